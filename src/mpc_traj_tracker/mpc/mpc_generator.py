@@ -1,4 +1,6 @@
 import os
+import json
+import hashlib
 
 import numpy as np
 import casadi.casadi as cs
@@ -21,36 +23,60 @@ Comments:
 
 MAX_SOVLER_TIME = 5_000_000 # micros (default 5 sec)
 
+# Cargo configuration for release builds, placed in the build directory so it applies to the generated crates.
+# The solver is tuned for the building machine (target-cpu/march=native), rebuild it on a different machine.
+# The rustflags use a catch-all target cfg because build.rustflags is ignored when any target.*.rustflags matches
+# (OpEn sets these for macOS), while matching target.* entries are joined.
+CARGO_CONFIG_HEADER = '# Autogenerated by MpcModule'
+CARGO_RELEASE_CONFIG = f'''{CARGO_CONFIG_HEADER}
+[profile.release]
+lto = "fat"
+codegen-units = 1
+
+[target.'cfg(all())']
+rustflags = ["-C", "target-cpu=native"]
+
+[env]
+CFLAGS = "-O3 -ffast-math -march=native -fno-math-errno"
+'''
+
 #%%## Helper functions ###
+def prod_rows(mtx:cs.SX):
+    # Product over the rows (like sum1 but multiplying), reduced pairwise to keep the graph balanced
+    while mtx.shape[0] > 1:
+        half = mtx.shape[0] // 2
+        prod = mtx[:half,:] * mtx[half:2*half,:]
+        mtx = cs.vertcat(prod, mtx[2*half:,:]) # the odd row (if any) is carried to the next round
+    return mtx
+
 def dist_to_points_square(point:cs.SX, points:List[Union[cs.SX, cs.DM]]):
-    return cs.sum1((point-points)**2) # sum1 is summing each column
+    return (points[0,:]-point[0])**2 + (points[1,:]-point[1])**2 # every column is a point
 
-def dist_to_lineseg(point:cs.SX, line_segment:List[Union[cs.SX, cs.DM]]):
-    # Ref: https://math.stackexchange.com/questions/330269/the-distance-from-a-point-to-a-line-segment
-    (p, s1, s2) = (point[:2], line_segment[0], line_segment[1])
-    s2s1 = s2-s1 # line segment
-    t_hat = cs.dot(p-s1,s2s1)/(s2s1[0]**2+s2s1[1]**2+1e-16)
-    t_star = cs.fmin(cs.fmax(t_hat,0.0),1.0) # limit t
-    temp_vec = s1 + t_star*s2s1 - p # vector pointing to closest point
-    distance = cs.sqrt(temp_vec[0]**2+temp_vec[1]**2)
-    return distance
+def ellipse_local_coords(point:cs.SX, ellipse_param:List[Union[cs.SX, cs.DM]]):
+    # Coordinates of the point in the frame of the ellipse (centered and rotated)
+    x, y = point[0], point[1]
+    cx, cy, ang = ellipse_param[0], ellipse_param[1], ellipse_param[4]
+    (dx, dy) = (x-cx, y-cy)
+    (cos_ang, sin_ang) = (cs.cos(ang), cs.sin(ang))
+    return dx*cos_ang+dy*sin_ang, dx*sin_ang-dy*cos_ang
 
-def inside_ellipses(point:cs.SX, ellipse_param:List[Union[cs.SX, cs.DM]]):
+def inside_ellipses(point:cs.SX, ellipse_param:List[Union[cs.SX, cs.DM]], local_coords:tuple=None):
     # Center: (cx, cy), semi-axes: (rx, ry), rotation angle to x axis: ang
     # If inside, return positive value, else return negative value
-    x, y = point[0], point[1]
-    cx, cy, rx, ry, ang = ellipse_param[0], ellipse_param[1], ellipse_param[2], ellipse_param[3], ellipse_param[4]
-    is_inside = 1 - ((x-cx)*cs.cos(ang)+(y-cy)*cs.sin(ang))**2 / (rx+1e-6)**2 - ((x-cx)*cs.sin(ang)-(y-cy)*cs.cos(ang))**2 / (ry+1e-6)**2
+    # The local coordinates can be given if they are shared by several ellipses with the same center and angle
+    rx, ry = ellipse_param[2], ellipse_param[3]
+    if local_coords is None:
+        local_coords = ellipse_local_coords(point, ellipse_param)
+    (x_local, y_local) = local_coords
+    is_inside = 1 - x_local**2 / (rx+1e-6)**2 - y_local**2 / (ry+1e-6)**2
     return is_inside
 
 def inside_pollygon(point:cs.SX, b:cs.SX, a0:cs.SX, a1:cs.SX):
     # Each half-space/edge is defined by b - [a0,a1]*[x,y]' > 0
     # If prod(|max(0,all)|)>0, then the point is inside; Otherwise not.
-    eq_mtx = cs.horzcat(a0, a1, b)
-    result = cs.mtimes(eq_mtx, cs.vertcat(-point[0], -point[1], 1))
-    is_inside = 1
-    for i in range(result.shape[0]):
-        is_inside *= cs.fmax(0, result[i]) ** 2
+    # Multiple polygons can be checked at once if b, a0, a1 are matrices (every column is a polygon).
+    result = b - a0*point[0] - a1*point[1]
+    is_inside = prod_rows(cs.fmax(0, result)**2)
     return is_inside
 
 def outside_polygon(point:cs.SX, b:list, a0:list, a1:list):
@@ -58,22 +84,17 @@ def outside_polygon(point:cs.SX, b:list, a0:list, a1:list):
     # If sum(|min(0,all)|)>0, then the point is outside; Otherwise not.
     eq_mtx = cs.DM([a0, a1, b]).T
     result = cs.mtimes(eq_mtx, cs.vertcat(-point[0], -point[1], 1))
-    is_outside = 0
-    for i in range(result.shape[0]):
-        is_outside += cs.fmin(0, result[i]) ** 2
+    is_outside = cs.sum1(cs.fmin(0, result)**2)
     return is_outside
 
 def angle_between_lines(l1:List[list], l2:List[list], normalized:bool=False):
     # line (np.array): [[x0 x1], [y0 y1]]
+    # atan2 does not need normalized vectors, 'normalized' is kept for compatibility
     vec1 = l1[:,1] - l1[:,0]
     vec2 = l2[:,1] - l2[:,0]
-    cos_angle = cs.dot(vec1, vec2)
-    if not normalized:
-        cos_angle /= (cs.norm_2(vec1)*cs.norm_2(vec2) + 1e-10)
-    else:
-        cos_angle = cs.fmin(cos_angle,  1.0-1e-10)
-        cos_angle = cs.fmax(cos_angle, -1.0+1e-10)
-    angle = cs.acos(cos_angle) * cs.sign(vec2[0]*vec1[1]-vec2[1]*vec1[0]) # sign +-1
+    cross = vec2[0]*vec1[1] - vec2[1]*vec1[0] # positive if vec2 is clockwise from vec1
+    dot = vec1[0]*vec2[0] + vec1[1]*vec2[1]
+    angle = cs.atan2(cross, dot)
     return angle
 
 #%%## Define the meta cost functions here ###
@@ -82,12 +103,12 @@ def cost_inside_polygon(point:Union[cs.SX, cs.DM], b:cs.SX, a0:cs.SX, a1:cs.SX,
     cost = indicator * weight
     return cost
 
-def cost_inside_ellipses(point:Union[cs.SX, cs.DM], ellipse_param:List[Union[cs.SX, cs.DM]], weight:float=1):
+def cost_inside_ellipses(point:Union[cs.SX, cs.DM], ellipse_param:List[Union[cs.SX, cs.DM]], weight:float=1, local_coords:tuple=None):
     if len(ellipse_param) > 5:
         alpha = ellipse_param[5]
     else:
         alpha = 1
-    indicator = inside_ellipses(point, ellipse_param) # indicator<0, if outside ellipse
+    indicator = inside_ellipses(point, ellipse_param, local_coords) # indicator<0, if outside ellipse
     indicator = cs.fmax(0.0, indicator)**2 * alpha
     cost = cs.sum1(indicator * weight)
     # narrowness = 5
@@ -122,17 +143,34 @@ def cost_refpath_deviation(point:Union[cs.SX, cs.DM], line_segments:List[Union[c
     Comments:
         The 'line_segments' contains segments which are end-to-end.
     '''
-    distances_sqrt = cs.SX.ones(1)
-    for i in range(len(line_segments)-1):
-        distance = dist_to_lineseg(point, [line_segments[i], line_segments[i+1]])
-        distances_sqrt = cs.horzcat(distances_sqrt, distance**2)
-    cost = cs.mmin(distances_sqrt[1:]) * weight
+    # Stack all segments column-wise, every column of s1/s2 is a start/end point
+    s1 = cs.hcat(line_segments[:-1])
+    s2 = cs.hcat(line_segments[1:])
+    return cost_refpath_deviation_vec(point, s1, s2, weight)
+
+def cost_refpath_deviation_vec(point:Union[cs.SX, cs.DM], s1:Union[cs.SX, cs.DM], s2:Union[cs.SX, cs.DM], weight:float=1):
+    '''
+    Description:
+        [Cost] Reference deviation error, same as "cost_refpath_deviation" but with pre-stacked segments.
+    Arguments:
+        s1 - start points of all segments, every column is a point (2*N)
+        s2 - end points of all segments, every column is a point (2*N)
+    Comments:
+        Distance to a segment: https://math.stackexchange.com/questions/330269/the-distance-from-a-point-to-a-line-segment
+    '''
+    s2s1 = s2 - s1
+    t_hat = ((point[0]-s1[0,:])*s2s1[0,:] + (point[1]-s1[1,:])*s2s1[1,:]) / (s2s1[0,:]**2+s2s1[1,:]**2+1e-16)
+    t_star = cs.fmin(cs.fmax(t_hat,0.0),1.0) # limit t
+    temp_x = s1[0,:] + t_star*s2s1[0,:] - point[0]
+    temp_y = s1[1,:] + t_star*s2s1[1,:] - point[1]
+    cost = cs.mmin(temp_x**2+temp_y**2) * weight
     return cost
 
 def cost_refpoint_detach(point:Union[cs.SX, cs.DM], ref_point:Union[cs.SX, cs.DM], ref_distance:float, weight:float=1):
     # The robot should stay a constant distance with some leader
-    actual_distance = cs.sqrt(cs.sum1((point-ref_point)**2))
-    cost = (actual_distance - ref_distance)**2 * weight
+    # Compared on squared distances to avoid the sqrt (not differentiable at 0)
+    actual_distance_sq = cs.sum1((point-ref_point)**2)
+    cost = (actual_distance_sq - ref_distance**2)**2 * weight
     return cost
 
 #%%## Main class ###
@@ -146,7 +184,10 @@ class MpcModule:
         print_name    <str>     - The name to print while running this class.
         config        <dotdict> - As above mentioned.
     Functions
-        build              <pre>  - Build the MPC problem and solver.
+        build               <pre>  - Build the MPC problem and solver.
+        build_key           <get>  - Identify a build to skip rebuilding an identical solver.
+        write_cargo_config  <pre>  - Write the Cargo configuration for optimized release builds.
+        remove_cargo_config <pre>  - Remove the Cargo configuration written for release builds.
     '''
     def __init__(self, config:Configurator):
         self.__print_name = '[MPC]'
@@ -156,13 +197,15 @@ class MpcModule:
         self.ns = self.config.ns        # number of states
         self.nu = self.config.nu        # number of inputs
         self.N_hor = self.config.N_hor  # control/pred horizon
+        self.n_edges = self.config.nstcobs // 3 # edges per static obstacle, 3 means b, a0, a1
 
-    def build(self, dynamics: Callable[[cs.SX, cs.SX, float], cs.SX], use_tcp:bool=False):
+    def build(self, dynamics: Callable[[cs.SX, cs.SX, float], cs.SX], use_tcp:bool=False, force_rebuild:bool=False):
         """Build the MPC problem and solver, including states, inputs, cost, and constraints.
 
         Args:
             dynamics: Callable function that generates next state given the current state and action.
             use_tcp : If the solver will be called directly or via TCP.
+            force_rebuild: If the solver should be rebuilt even if an identical one is already built.
         Conmments:
             Inputs (u): speed, angular speed
             states (s): x, y, theta, e (e is the channel width / allowable divation from reference, not included yet)
@@ -191,89 +234,129 @@ class MpcModule:
         (qpos, qvel, qtheta, rv, rw)                    = (q[0], q[1], q[2], q[3], q[4])
         (qN, qthetaN, qrpd, acc_penalty, w_acc_penalty) = (q[5], q[6], q[7], q[8], q[9])
         
-        path_ref = [cs.vertcat(r[i*self.ns], r[i*self.ns+1]) for i in range(self.N_hor)]
-        path_ref.append(path_ref[-1])
-
-        cost = 0
-        penalty_constraints = 0
-        state_next = cs.vcat([x,y,theta])
-        for kt in range(0, self.N_hor): # LOOP OVER TIME STEPS
-            
-            ### Run step with motion model
-            u_t = u[kt*self.nu:(kt+1)*self.nu]  # inputs at time t
-            state_next = dynamics(state_next, u_t, self.ts) # Kinematic/dynamic model
-
-            ### Reference deviation costs
-            cost += cost_refpath_deviation(state_next, path_ref[kt:], weight=qrpd) # [cost] reference path deviation cost
-            cost += cost_refvalue_deviation(u_t[0], r[self.ns*self.N_hor+kt], weight=qvel) # [cost] refenrence velocity deviation
-            cost += cost_control_action(u_t, cs.vertcat(rv, rw)) # [cost] penalize control actions
-
-            ### Fleet collision avoidance
-            other_robots_x = c[kt*self.ns  ::self.ns*self.N_hor] # first  state
-            other_robots_y = c[kt*self.ns+1::self.ns*self.N_hor] # second state
-            other_robots = cs.hcat([other_robots_x, other_robots_y]) # states of other robots at time kt (Nother*ns)
-            other_robots = cs.transpose(other_robots) # every column is a state of a robot
-            cost += cost_fleet_collision(state_next[:2], other_robots, safe_distance=self.config.vehicle_width, weight=1000)
-
-            ### Static obstacles
-            for i in range(self.config.Nstcobs):
-                eq_param = o_s[i*self.config.nstcobs : (i+1)*self.config.nstcobs]
-                n_edges = int(self.config.nstcobs / 3) # 3 means b, a0, a1
-                b, a0, a1 = eq_param[:n_edges], eq_param[n_edges:2*n_edges], eq_param[2*n_edges:]
-
-                inside_stc_obstacle = inside_pollygon(state_next, b, a0, a1)
-                penalty_constraints += cs.fmax(0, cs.vertcat(inside_stc_obstacle))
-
-                # cost += cost_inside_polygon(state_next, b, a0, a1, weight=q_stc[kt])
-
-            ### Dynamic obstacles
-            # (x, y, rx, ry, tilted_angle, alpha) for obstacle 0 for N_hor steps, then similar for obstalce 1 for N_hor steps...
-            x_dyn     = o_d[kt*self.config.ndynobs  ::self.config.ndynobs*self.N_hor]
-            y_dyn     = o_d[kt*self.config.ndynobs+1::self.config.ndynobs*self.N_hor]
-            rx_dyn    = o_d[kt*self.config.ndynobs+2::self.config.ndynobs*self.N_hor]
-            ry_dyn    = o_d[kt*self.config.ndynobs+3::self.config.ndynobs*self.N_hor]
-            As        = o_d[kt*self.config.ndynobs+4::self.config.ndynobs*self.N_hor]
-            alpha_dyn = o_d[kt*self.config.ndynobs+5::self.config.ndynobs*self.N_hor]
-
-            inside_dyn_obstacle = inside_ellipses(state_next, [x_dyn, y_dyn, rx_dyn, ry_dyn, As])
-            penalty_constraints += cs.fmax(0, inside_dyn_obstacle)
-
-            cost += cost_inside_ellipses(state_next, [x_dyn, y_dyn, rx_dyn+self.config.social_margin, ry_dyn+self.config.social_margin, As, alpha_dyn], weight=q_dyn[kt])
+        # Reference path segments, the last point is repeated (every column is a point)
+        path_ref = cs.reshape(r[:self.ns*self.N_hor], self.ns, self.N_hor)
+        path_ref = cs.hcat([path_ref[:2,:], path_ref[:2,-1]])
+        (path_s1, path_s2) = (path_ref[:,:-1], path_ref[:,1:])
+
+        # Static obstacles, every column is an obstacle
+        stc_param = cs.reshape(o_s, self.config.nstcobs, self.config.Nstcobs)
+
+        # Other robots and dynamic obstacles, every row is an object and every ns/ndynobs columns are one step
+        # (x, y, rx, ry, tilted_angle, alpha) for obstacle 0 for N_hor steps, then similar for obstalce 1 for N_hor steps...
+        other_states = cs.reshape(c, self.ns*self.N_hor, self.config.Nother).T
+        dyn_param = cs.reshape(o_d, self.config.ndynobs*self.N_hor, self.config.Ndynobs).T
+
+        # Motion model, expanded once and reused at every step
+        # (the trigonometric terms of the heading are shared within a step, no other term uses them, so they are not carried in the state)
+        s_sym = cs.SX.sym('s_', self.ns)
+        u_sym = cs.SX.sym('u_', self.nu)
+        f_dyn = cs.Function('f_dyn', [s_sym, u_sym], [dynamics(s_sym, u_sym, self.ts)])
+
+        ### One step: motion model, step costs and penalties
+        state_t     = cs.SX.sym('state_t', self.ns)
+        u_t         = cs.SX.sym('u_t', self.nu)
+        other_t     = cs.SX.sym('other_t', self.config.Nother, self.ns)  # every row is the state of a robot
+        stc_param_t = cs.SX.sym('stc_t', self.config.nstcobs, self.config.Nstcobs)
+        dyn_param_t = cs.SX.sym('dyn_t', self.config.Ndynobs, self.config.ndynobs) # every row is an obstacle
+        q_dyn_t     = cs.SX.sym('qdyn_t')
+
+        state_next = f_dyn(state_t, u_t) # Kinematic/dynamic model
+        step_cost = 0
+
+        # Fleet collision avoidance
+        other_robots = other_t[:,:2].T # every column is a state (x, y) of a robot
+        step_cost += cost_fleet_collision(state_next[:2], other_robots, safe_distance=self.config.vehicle_width, weight=1000)
+
+        # Static obstacles
+        n_edges = self.n_edges
+        b_stc, a0_stc, a1_stc = stc_param_t[:n_edges,:], stc_param_t[n_edges:2*n_edges,:], stc_param_t[2*n_edges:,:]
+        inside_stc_obstacle = inside_pollygon(state_next, b_stc, a0_stc, a1_stc) # one column per obstacle
+        # step_cost += cs.sum2(cost_inside_polygon(state_next, b_stc, a0_stc, a1_stc, weight=q_stc_t))
+
+        # Dynamic obstacles (x, y, rx, ry, tilted_angle, alpha)
+        (x_dyn, y_dyn, rx_dyn, ry_dyn) = (dyn_param_t[:,0], dyn_param_t[:,1], dyn_param_t[:,2], dyn_param_t[:,3])
+        (As, alpha_dyn)                = (dyn_param_t[:,4], dyn_param_t[:,5])
+
+        dyn_local_coords = ellipse_local_coords(state_next, [x_dyn, y_dyn, rx_dyn, ry_dyn, As]) # shared by the penalty and the cost
+        inside_dyn_obstacle = inside_ellipses(state_next, [x_dyn, y_dyn, rx_dyn, ry_dyn, As], dyn_local_coords)
+
+        step_cost += cost_inside_ellipses(state_next, [x_dyn, y_dyn, rx_dyn+self.config.social_margin, ry_dyn+self.config.social_margin, As, alpha_dyn], weight=q_dyn_t, local_coords=dyn_local_coords)
+
+        f_step = cs.Function('f_step', [state_t, u_t, other_t, stc_param_t, dyn_param_t, q_dyn_t],
+                                       [state_next, step_cost, inside_stc_obstacle, inside_dyn_obstacle])
+
+        ### Roll out over the horizon (LOOP OVER TIME STEPS)
+        f_rollout = f_step.mapaccum('f_rollout', self.N_hor)
+        (states, step_costs, inside_stc_obstacles, inside_dyn_obstacles) = f_rollout(
+            cs.vcat([x,y,theta]), cs.reshape(u, self.nu, self.N_hor), other_states, cs.repmat(stc_param, 1, self.N_hor), dyn_param, q_dyn.T)
+        state_final = states[:,-1]
+
+        cost = cs.sum2(step_costs)
+        # One entry per obstacle per step, static indicators are products of squares (nonnegative) and need no clamp
+        penalty_constraints = cs.vertcat(cs.vec(inside_stc_obstacles), cs.fmax(0, cs.vec(inside_dyn_obstacles)))
+
+        ### Reference deviation costs
+        for kt in range(0, self.N_hor):
+            cost += cost_refpath_deviation_vec(states[:,kt], path_s1[:,kt:], path_s2[:,kt:], weight=qrpd) # [cost] reference path deviation cost
+
+        ### Reference velocity and control action costs (all steps at once)
+        v = u[0::2] # velocity
+        w = u[1::2] # angular velocity
+        cost += cs.sum1(cost_refvalue_deviation(v, r[self.ns*self.N_hor:], weight=qvel)) # [cost] refenrence velocity deviation
+        cost += rv*cs.sum1(v**2) + rw*cs.sum1(w**2) # [cost] penalize control actions
         
         ### Terminal cost
         # state_final_goal = cs.vertcat(x_goal, y_goal, theta_goal)
-        # cost += cost_refstate_deviation(state_next, state_final_goal, weights=cs.vertcat(qN, qN, qthetaN)) 
-        cost += qN*((state_next[0]-x_goal)**2 + (state_next[1]-y_goal)**2) + qthetaN*(state_next[2]-theta_goal)**2 # terminated cost
+        # cost += cost_refstate_deviation(state_final, state_final_goal, weights=cs.vertcat(qN, qN, qthetaN)) 
+        cost += qN*((state_final[0]-x_goal)**2 + (state_final[1]-y_goal)**2) + qthetaN*(state_final[2]-theta_goal)**2 # terminated cost
 
         ### Max speed bound
-        umin = [self.config.lin_vel_min, -self.config.ang_vel_max] * self.N_hor
-        umax = [self.config.lin_vel_max,  self.config.ang_vel_max] * self.N_hor
+        umin = np.tile([self.config.lin_vel_min, -self.config.ang_vel_max], self.N_hor).tolist()
+        umax = np.tile([self.config.lin_vel_max,  self.config.ang_vel_max], self.N_hor).tolist()
         bounds = og.constraints.Rectangle(umin, umax)
 
         ### Acceleration bounds and cost
-        v = u[0::2] # velocity
-        w = u[1::2] # angular velocity
         acc   = (v-cs.vertcat(v_init, v[0:-1]))/self.ts
         w_acc = (w-cs.vertcat(w_init, w[0:-1]))/self.ts
         acc_constraints = cs.vertcat(acc, w_acc)
         # Acceleration bounds
-        acc_min   = [ self.config.lin_acc_min] * self.N_hor 
-        w_acc_min = [-self.config.ang_acc_max] * self.N_hor
-        acc_max   = [ self.config.lin_acc_max] * self.N_hor
-        w_acc_max = [ self.config.ang_acc_max] * self.N_hor
-        acc_bounds = og.constraints.Rectangle(acc_min + w_acc_min, acc_max + w_acc_max)
+        acc_min = np.repeat([self.config.lin_acc_min, -self.config.ang_acc_max], self.N_hor).tolist() # [acc]*N_hor + [w_acc]*N_hor
+        acc_max = np.repeat([self.config.lin_acc_max,  self.config.ang_acc_max], self.N_hor).tolist()
+        acc_bounds = og.constraints.Rectangle(acc_min, acc_max)
         # Accelerations cost
-        cost += cs.mtimes(acc.T, acc)*acc_penalty
-        cost += cs.mtimes(w_acc.T, w_acc)*w_acc_penalty
+        cost += acc_penalty * cs.sumsqr(acc)
+        cost += w_acc_penalty * cs.sumsqr(w_acc)
+
+        ### Simplify the expressions before code generation
+        cost = cs.simplify(cost)
+        if hasattr(cs, 'cse'): # CasADi>=3.6 (no-op on the pinned 3.5.5), the rolled-out steps are inlined here as well
+            (cost, penalty_constraints) = cs.cse([cost, penalty_constraints])
+
+        ### Skip the code generation and compilation if the same solver is already built
+        build_key = self.build_key(cs.Function('key', [u, z], [cost, penalty_constraints, acc_constraints]), use_tcp)
+        meta_path = os.path.join(self.config.build_directory, self.config.optimizer_name, 'build_meta.json')
+        if (not force_rebuild) and os.path.isfile(meta_path):
+            with open(meta_path, 'r') as f:
+                if json.load(f).get('key') == build_key:
+                    print(f'{self.__print_name} MPC module already built (key {build_key}), skip building.')
+                    return
+        if os.path.isfile(meta_path): # the key is only kept for a finished build
+            os.remove(meta_path)
 
         problem = og.builder.Problem(u, z, cost) \
             .with_constraints(bounds) \
             .with_aug_lagrangian_constraints(acc_constraints, acc_bounds)
         problem.with_penalty_constraints(penalty_constraints)
 
+        build_mode = 'debug' if self.config.build_type == 'debug' else 'release'
         build_config = og.config.BuildConfiguration() \
             .with_build_directory(self.config.build_directory) \
-            .with_build_mode(self.config.build_type)
+            .with_build_mode(build_mode)
+        if build_mode == 'release':
+            self.write_cargo_config()
+        else: # the release flags are not limited to the release profile
+            self.remove_cargo_config()
         if not use_tcp:
             build_config.with_build_python_bindings()
         else:
@@ -291,10 +374,51 @@ class MpcModule:
             # max_outer_iterations = 10  (increase the penalty factor)
             # penalty_weight_update_factor = 5.0
             # max_duration_micros = 5_000_000 (5 sec)
+        if getattr(self.config, 'warmstart', False): # the initial guess is the shifted last solution, avoid over-solving
+            solver_config.with_initial_tolerance(1e-3) \
+                         .with_max_outer_iterations(8)
 
         builder = og.builder.OpEnOptimizerBuilder(problem, meta, build_config, solver_config) \
             .with_verbosity_level(1)
         builder.build()
 
+        with open(meta_path, 'w') as f:
+            json.dump({'key': build_key}, f)
+
         print(f'{self.__print_name} MPC module built.')
 
+    def build_key(self, problem_function:cs.Function, use_tcp:bool=False) -> str:
+        """Identify a build by hashing the configuration, the generated expressions, and the interface type.
+
+        Args:
+            problem_function: Function of (u, z) returning everything that is code-generated (cost and constraints).
+        Comments:
+            Toolchain changes (Rust, OpEn) are not detected, use "force_rebuild" then.
+        """
+        config_items = [(k, v) for k, v in vars(self.config).items() if not k.startswith('_')]
+        hasher = hashlib.sha1(repr((sorted(config_items), use_tcp)).encode())
+        hasher.update(problem_function.serialize().encode())
+        return hasher.hexdigest()[:12]
+
+    def write_cargo_config(self):
+        """Write the Cargo configuration (LTO, native CPU, optimized C flags) into the build directory.
+
+        Comments:
+            Cargo looks for ".cargo/config.toml" in the parent directories of the generated crates,
+            so this also applies to the "icasadi" C sources (compiled with CFLAGS) and the interfaces.
+        """
+        cargo_dir = os.path.join(self.config.build_directory, '.cargo')
+        os.makedirs(cargo_dir, exist_ok=True)
+        with open(os.path.join(cargo_dir, 'config.toml'), 'w') as f:
+            f.write(CARGO_RELEASE_CONFIG)
+
+    def remove_cargo_config(self):
+        """Remove the Cargo configuration written by "write_cargo_config" (other files are kept)."""
+        cargo_config_path = os.path.join(self.config.build_directory, '.cargo', 'config.toml')
+        if not os.path.isfile(cargo_config_path):
+            return
+        with open(cargo_config_path, 'r') as f:
+            autogenerated = f.readline().startswith(CARGO_CONFIG_HEADER)
+        if autogenerated:
+            os.remove(cargo_config_path)
+
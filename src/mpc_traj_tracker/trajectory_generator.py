@@ -90,6 +90,7 @@ class TrajectoryGenerator:
         self.past_actions = []
         self.cost_timelist = []
         self.solver_time_timelist = []
+        self.last_solution = None # for warm start
 
         self.idx_ref = 0 # for reference trajectory following
 
@@ -162,6 +163,16 @@ class TrajectoryGenerator:
         return terminated
 
 
+    @staticmethod
+    def shift_initial_guess(last_solution:list, nu:int, take_steps:int=1) -> list:
+        '''
+        Description:
+            Shift the last solution by the taken steps and repeat the last action, as the initial guess of the next step.
+        '''
+        shifted = list(last_solution[nu*take_steps:])
+        shifted += list(last_solution[-nu:]) * take_steps
+        return shifted
+
     @staticmethod
     def get_global_ref_traj(ts: float, ref_path:PathNodeList, state: tuple, speed:float) -> TrajectoryNodeList:
         '''
@@ -274,6 +285,9 @@ class TrajectoryGenerator:
                  other_robot_states + \
                  stc_constraints + dyn_constraints + self.stc_weights + self.dyn_weights
 
+        if (initial_guess is None) and getattr(self.config, 'warmstart', False) and (self.last_solution is not None):
+            initial_guess = self.shift_initial_guess(self.last_solution, self.nu, self.config.action_steps)
+
         try:
             taken_states, pred_states, actions, cost, solver_time, exit_status = self.run_solver(params, self.state, self.config.action_steps, initial_guess)
         except RuntimeError as err:
@@ -301,6 +315,7 @@ class TrajectoryGenerator:
             parameters   <list>:   - All parameters used by MPC, defined in 'build'.
             state        <cs>  :   - The overall states.
             take_steps   <int> :   - The number of control step taken by the input (default 1).
+            initial_guess <list>:  - The initial guess of the actions (default None).
         Return:
             taken_states <list> :  - List of taken states, length equal to take_steps.
             pred_states  <list> :  - List of predicted states at this step, length equal to horizon N.
@@ -312,7 +327,7 @@ class TrajectoryGenerator:
             The motion model (dynamics) is defined initially.
         '''
         if self.use_tcp:
-            return self.run_solver_tcp(parameters, state, take_steps)
+            return self.run_solver_tcp(parameters, state, take_steps, initial_guess)
 
         import opengen as og
         solution:og.opengen.tcp.solver_status.SolverStatus = self.solver.run(parameters, initial_guess)
@@ -320,6 +335,7 @@ class TrajectoryGenerator:
         u = solution.solution
         cost:float = solution.cost
         exit_status: str = solution.exit_status
+        self.last_solution = None if exit_status in self.config.bad_exit_codes else u # only warm start from good solutions
         solver_time: float = solution.solve_time_ms
         
         taken_states:List[np.ndarray] = []
@@ -338,14 +354,15 @@ class TrajectoryGenerator:
         actions = [np.array(action) for action in actions]
         return taken_states, pred_states, actions, cost, solver_time, exit_status
 
-    def run_solver_tcp(self, parameters:list, state: np.ndarray, take_steps:int=1):
-        solution = self.mng.call(parameters)
+    def run_solver_tcp(self, parameters:list, state: np.ndarray, take_steps:int=1, initial_guess:np.ndarray=None):
+        solution = self.mng.call(parameters, initial_guess=initial_guess)
         if solution.is_ok():
             # Solver returned a solution
             solution_data = solution.get()
             u = solution_data.solution
             cost: float = solution_data.cost
             exit_status: str = solution_data.exit_status
+            self.last_solution = None if exit_status in self.config.bad_exit_codes else u # only warm start from good solutions
             solver_time: float = solution_data.solve_time_ms
         else:
             # Invocation failed - an error report is returned